@@ -3,6 +3,7 @@ from pydantic import BaseModel
 from db.firebase import users_collection
 from auth.auth_handler import create_access_token
 from firebase_admin import auth as firebase_auth
+from middleware.cache import bump_version
 
 auth_router = APIRouter()
 
@@ -35,6 +36,7 @@ async def register(user: UserProfile):
         "email": user.email,
         "avatar": avatar_url
     })
+    bump_version("users")
 
     # ✅ Optional custom access token (JWT)
     token = create_access_token({"sub": uid})
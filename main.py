@@ -6,8 +6,16 @@ from ws.socket_router import socket_router
 from routers.message_router import message_router
 from routers.password_router import password_router
 from fastapi.middleware.cors import CORSMiddleware
+from middleware.rate_limiter import rate_limit_middleware
+try:
+    from brotli_asgi import BrotliMiddleware  # Optional extra, see requirements.txt
+except ImportError:
+    BrotliMiddleware = None
+from fastapi.middleware.gzip import GZipMiddleware
 app = FastAPI()
 
+# 🚦 Per-IP rate limit (registered first so CORS headers still wrap 429s)
+app.middleware("http")(rate_limit_middleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,8 +23,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After"],
 )
 
+# 📦 Compress large listings (brotli if available, gzip otherwise)
+if BrotliMiddleware:
+    app.add_middleware(BrotliMiddleware, minimum_size=1000, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 # Routes
 app.include_router(auth_router, prefix="/auth")
 app.include_router(connect_router, prefix="/connect")
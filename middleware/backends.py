@@ -0,0 +1,110 @@
+#Backends
+# State for the rate limiter ("buckets") and HTTP cache ("versions").
+#
+# The in-memory defaults are only correct with a single worker. With several
+# workers (WEB_CONCURRENCY > 1) each process sees only its own writes:
+#   - rate limits get looser (each worker has its own buckets)
+#   - ETag versions go stale, so a worker could answer 304 for data changed
+#     through another worker. check_etag() therefore stops sending ETags on
+#     multi-worker deploys unless the "versions" backend is shared.
+# Shared backends implement the same methods and are installed with
+# set_backend(name, backend, shared=True). Set CACHE_VERSION_BACKEND=firestore
+# to use the bundled Firestore version counters.
+import os
+import time
+import threading
+from typing import Dict, List, Tuple
+from firebase_admin import firestore
+from db.firebase import firestore_db
+
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+# How often idle buckets are swept from memory
+BUCKET_SWEEP_INTERVAL = 60
+
+
+class InMemoryBucketBackend:
+    def __init__(self):
+        # key -> (tokens, last refill, time the bucket is full again)
+        self.buckets: Dict[str, Tuple[float, float, float]] = {}
+        self.lock = threading.Lock()
+        self.last_sweep = time.monotonic()
+
+    def take(self, key: str, rate: float, capacity: int, cost: float = 1) -> Tuple[bool, float]:
+        """Consume `cost` tokens. Returns (allowed, seconds until enough tokens)."""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_sweep >= BUCKET_SWEEP_INTERVAL:
+                self._sweep(now)
+
+            tokens, last, _ = self.buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            full_at = now + (capacity - tokens) / rate if rate > 0 else float("inf")
+            self.buckets[key] = (tokens, now, full_at)
+            if allowed:
+                return True, 0.0
+            return False, (cost - tokens) / rate if rate > 0 else float("inf")
+
+    def _sweep(self, now: float):
+        # A full bucket is the same as no bucket, so drop it
+        self.buckets = {key: state for key, state in self.buckets.items() if state[2] > now}
+        self.last_sweep = now
+
+
+class InMemoryVersionBackend:
+    def __init__(self):
+        self.versions: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def get(self, keys: List[str]) -> List[int]:
+        with self.lock:
+            return [self.versions.get(key, 0) for key in keys]
+
+    def bump(self, key: str):
+        with self.lock:
+            self.versions[key] = self.versions.get(key, 0) + 1
+
+
+class FirestoreVersionBackend:
+    # One small doc per key: a single batched read replaces the listing queries
+    def __init__(self, collection: str = "cache_versions"):
+        self.collection = firestore_db.collection(collection)
+
+    def get(self, keys: List[str]) -> List[int]:
+        docs = firestore_db.get_all([self.collection.document(key) for key in keys])
+        found = {doc.id: doc.to_dict().get("v", 0) for doc in docs if doc.exists}
+        return [found.get(key, 0) for key in keys]
+
+    def bump(self, key: str):
+        self.collection.document(key).set({"v": firestore.Increment(1)}, merge=True)
+
+
+backends = {
+    "buckets": InMemoryBucketBackend(),
+    "versions": InMemoryVersionBackend(),
+}
+shared_backends = set()
+
+
+def set_backend(name: str, backend, shared: bool = True):
+    backends[name] = backend
+    if shared:
+        shared_backends.add(name)
+    else:
+        shared_backends.discard(name)
+
+
+def get_backend(name: str):
+    return backends[name]
+
+
+def is_consistent(name: str) -> bool:
+    # True when every worker sees the same state for this backend
+    return WORKERS <= 1 or name in shared_backends
+
+
+if os.environ.get("CACHE_VERSION_BACKEND") == "firestore":
+    set_backend("versions", FirestoreVersionBackend())
@@ -0,0 +1,43 @@
+#HTTP caching
+import uuid
+from typing import List, Optional
+from fastapi import Request, Response
+from middleware.backends import get_backend, is_consistent, shared_backends
+
+# Changes on every restart so ETags from a previous process never match.
+# Shared counters outlive the process, so they don't need it.
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+def bump_version(*keys: str):
+    # Call after every write that changes what a cached listing returns
+    for key in keys:
+        get_backend("versions").bump(key)
+
+
+def make_etag(keys: List[str]) -> str:
+    versions = get_backend("versions").get(keys)
+    prefix = "shared" if "versions" in shared_backends else BOOT_ID
+    tag = "-".join([prefix] + [str(v) for v in versions])
+    # Weak: the body may be gzip/brotli encoded differently per request
+    return f'W/"{tag}"'
+
+
+def check_etag(request: Request, response: Response, *keys: str) -> Optional[Response]:
+    """Set the ETag on `response`, or return a 304 if the client's copy is current."""
+    # Per-worker counters can't see other workers' writes; never risk a stale 304
+    if not is_consistent("versions"):
+        return None
+
+    etag = make_etag(list(keys))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        opaque = etag[2:]
+        if "*" in candidates or any(tag.removeprefix("W/") == opaque for tag in candidates):
+            return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,128 @@
+#RateLimiter
+# Note: sender_id / user_id aren't authenticated yet, so per-user limits are
+# keyed by (user, client IP). Spoofing a victim's ID from another machine only
+# drains that machine's bucket, never the victim's own.
+import os
+import logging
+import threading
+from typing import Dict, Tuple
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from middleware.backends import get_backend
+
+# Requests per second refilled into each bucket / max burst size
+HTTP_IP_RATE = float(os.environ.get("RATE_LIMIT_HTTP_IP_RATE", "20"))
+HTTP_IP_BURST = int(os.environ.get("RATE_LIMIT_HTTP_IP_BURST", "60"))
+SEND_USER_RATE = float(os.environ.get("RATE_LIMIT_SEND_USER_RATE", "2"))
+SEND_USER_BURST = int(os.environ.get("RATE_LIMIT_SEND_USER_BURST", "10"))
+WS_USER_RATE = float(os.environ.get("RATE_LIMIT_WS_USER_RATE", "2"))
+WS_USER_BURST = int(os.environ.get("RATE_LIMIT_WS_USER_BURST", "10"))
+# Every frame from one IP, across all its sockets and user IDs
+WS_IP_RATE = float(os.environ.get("RATE_LIMIT_WS_IP_RATE", "5"))
+WS_IP_BURST = int(os.environ.get("RATE_LIMIT_WS_IP_BURST", "20"))
+
+# Max sends a single user may have in flight at once
+SEND_MAX_CONCURRENT = int(os.environ.get("RATE_LIMIT_SEND_MAX_CONCURRENT", "4"))
+
+# Number of trusted proxies in front of the app (Render = 1). 0 trusts none
+# and uses the socket peer address. See README "Deployment".
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "0"))
+
+logger = logging.getLogger("uvicorn.error")
+warned_proxy_hops = False
+
+# WebSocket close code for policy violations (RFC 6455)
+WS_POLICY_VIOLATION = 1008
+
+
+class TokenBucketLimiter:
+    def __init__(self, name: str, rate: float, capacity: int, backend=None):
+        # A zero rate never refills, which would make Retry-After infinite
+        if rate <= 0 or capacity < 1:
+            raise ValueError(f"Rate limit '{name}' needs rate > 0 and burst >= 1")
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        # None means "whatever buckets backend is configured at call time"
+        self.backend = backend
+
+    def allow(self, key: str) -> Tuple[bool, float]:
+        backend = self.backend or get_backend("buckets")
+        return backend.take(f"{self.name}:{key}", self.rate, self.capacity)
+
+    def check(self, key: str):
+        # 🚦 Raise 429 when the bucket is empty
+        allowed, retry_after = self.allow(key)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests. Slow down.",
+                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+            )
+
+
+class ConcurrencyLimiter:
+    """Caps how many operations a single key may run at the same time."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key: str) -> bool:
+        with self.lock:
+            count = self.in_flight.get(key, 0)
+            if count >= self.limit:
+                return False
+            self.in_flight[key] = count + 1
+            return True
+
+    def release(self, key: str):
+        with self.lock:
+            count = self.in_flight.get(key, 0) - 1
+            if count > 0:
+                self.in_flight[key] = count
+            else:
+                self.in_flight.pop(key, None)
+
+
+def client_ip(connection) -> str:
+    # Works for both Request and WebSocket. Proxies append the address they saw,
+    # so only the entries added by our own trusted proxies can be believed;
+    # anything further left is client-controlled.
+    global warned_proxy_hops
+    if TRUSTED_PROXY_HOPS == 0 and not warned_proxy_hops and "x-forwarded-for" in connection.headers:
+        # Behind a proxy every client shares the proxy's IP bucket
+        warned_proxy_hops = True
+        logger.warning(
+            "X-Forwarded-For received but TRUSTED_PROXY_HOPS=0: all clients are rate limited "
+            "as the proxy's IP. Set TRUSTED_PROXY_HOPS to the number of proxies (Render = 1)."
+        )
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [ip.strip() for ip in connection.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return connection.client.host if connection.client else "unknown"
+
+
+def user_ip_key(user_id: str, connection) -> str:
+    return f"{user_id}@{client_ip(connection)}"
+
+
+http_ip_limiter = TokenBucketLimiter("http-ip", HTTP_IP_RATE, HTTP_IP_BURST)
+send_user_limiter = TokenBucketLimiter("send-user", SEND_USER_RATE, SEND_USER_BURST)
+ws_user_limiter = TokenBucketLimiter("ws-user", WS_USER_RATE, WS_USER_BURST)
+ws_ip_limiter = TokenBucketLimiter("ws-ip", WS_IP_RATE, WS_IP_BURST)
+send_concurrency = ConcurrencyLimiter(SEND_MAX_CONCURRENT)
+
+
+async def rate_limit_middleware(request: Request, call_next):
+    # 🚦 Per-IP limit on every HTTP route
+    allowed, retry_after = http_ip_limiter.allow(client_ip(request))
+    if not allowed:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Too many requests. Slow down."},
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+        )
+    return await call_next(request)
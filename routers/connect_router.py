@@ -1,8 +1,13 @@
 #ConnectRouter
-from fastapi import APIRouter, Body, Query, HTTPException
+from fastapi import APIRouter, Body, Query, HTTPException, Request, Response
 from db.firebase import users_collection, firestore_db as db
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
 from google.cloud.firestore_v1 import DocumentSnapshot
+from middleware.cache import check_etag, bump_version
 from datetime import datetime
+import hashlib
+import json
 
 connect_router = APIRouter()
 connections_collection = db.collection("connections")
@@ -13,38 +18,72 @@ def get_user_by_id(user_id: str):
         raise HTTPException(status_code=404, detail="User not found")
     return doc.to_dict() | {"user_id": doc.id}
 
+def connection_pair_id(user_a: str, user_b: str) -> str:
+    # Same doc for A->B and B->A, so a pair can only ever have one request.
+    # Hashed so any client string ('/', '__', ...) maps to a valid, unique doc ID.
+    return hashlib.sha256(json.dumps(sorted([user_a, user_b])).encode()).hexdigest()
+
 @connect_router.post("/send-request")
 def send_request(sender_id: str = Body(...), receiver_id: str = Body(...)):
-    sender = get_user_by_id(sender_id)
-    receiver = get_user_by_id(receiver_id)
-
-    existing = connections_collection.where("sender_id", "==", sender_id).where("receiver_id", "==", receiver_id).get()
-    if existing:
-        return {"message": "Request already sent or already connected"}
+    if sender_id == receiver_id:
+        raise HTTPException(status_code=400, detail="Cannot connect to yourself")
 
-    connections_collection.add({
-        "sender_id": sender_id,
-        "receiver_id": receiver_id,
-        "status": "pending",
-        "created_at": datetime.utcnow()
-    })
+    # 🔍 Both users in one batched read
+    user_docs = db.get_all([users_collection.document(sender_id), users_collection.document(receiver_id)])
+    if not all(doc.exists for doc in user_docs):
+        raise HTTPException(status_code=404, detail="User not found")
 
+    # ✅ create() fails if the pair doc exists, so concurrent clicks can't duplicate
+    try:
+        connections_collection.document(connection_pair_id(sender_id, receiver_id)).create({
+            "sender_id": sender_id,
+            "receiver_id": receiver_id,
+            "status": "pending",
+            "created_at": datetime.utcnow()
+        })
+    except AlreadyExists:
+        # A->B and B->A share one doc, so tell the caller which way it points
+        existing = connections_collection.document(connection_pair_id(sender_id, receiver_id)).get().to_dict()
+        status = existing.get("status", "pending")
+        direction = "sent" if existing.get("sender_id") == sender_id else "received"
+        if status == "accepted":
+            message = "Already connected"
+        elif direction == "sent":
+            message = "Request already sent"
+        else:
+            message = "This user already sent you a request; accept it instead"
+        return {"message": message, "status": status, "direction": direction}
+
+    bump_version(f"connections:{sender_id}", f"connections:{receiver_id}")
     return {"message": "Connection request sent", "status": "pending"}
 
+@firestore.transactional
+def _accept_pending(transaction, doc_ref, sender_id: str) -> bool:
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return False
+    data = snapshot.to_dict()
+    if data.get("sender_id") != sender_id or data.get("status") != "pending":
+        return False
+    transaction.update(doc_ref, {"status": "accepted"})
+    return True
+
 @connect_router.post("/accept-request")
 def accept_request(sender_id: str = Body(...), receiver_id: str = Body(...)):
-    pending_requests = connections_collection.where("sender_id", "==", sender_id).where("receiver_id", "==", receiver_id).where("status", "==", "pending").get()
+    doc_ref = connections_collection.document(connection_pair_id(sender_id, receiver_id))
 
-    if not pending_requests:
+    if not _accept_pending(db.transaction(), doc_ref, sender_id):
         return {"error": "No pending request found"}
 
-    for doc in pending_requests:
-        connections_collection.document(doc.id).update({"status": "accepted"})
-
+    bump_version(f"connections:{sender_id}", f"connections:{receiver_id}")
     return {"message": "Connection accepted"}
 
 @connect_router.get("/list")
-def get_connections(user_id: str = Query(...)):
+def get_connections(request: Request, response: Response, user_id: str = Query(...)):
+    not_modified = check_etag(request, response, f"connections:{user_id}")
+    if not_modified:
+        return not_modified
+
     connections = connections_collection.where("status", "==", "accepted").get()
 
     connected_users = []
@@ -62,7 +101,11 @@ def get_connections(user_id: str = Query(...)):
     return {"connections": connected_users}
 
 @connect_router.get("/users/all")
-def get_all_users():
+def get_all_users(request: Request, response: Response):
+    not_modified = check_etag(request, response, "users")
+    if not_modified:
+        return not_modified
+
     users = users_collection.stream()
     result = []
     for doc in users:
@@ -77,16 +120,18 @@ def get_all_users():
 
 @connect_router.get("/check-status")
 def check_connection_status(sender_id: str = Query(...), receiver_id: str = Query(...)):
-    requests = connections_collection.where("sender_id", "in", [sender_id, receiver_id])\
-        .where("receiver_id", "in", [sender_id, receiver_id]).get()
-
-    for req in requests:
-        return {"status": req.to_dict().get("status", "none")}
+    doc = connections_collection.document(connection_pair_id(sender_id, receiver_id)).get()
+    if doc.exists:
+        return {"status": doc.to_dict().get("status", "none")}
 
     return {"status": "none"}
 
 @connect_router.get("/sent-requests")
-def get_sent_requests(user_id: str = Query(...)):
+def get_sent_requests(request: Request, response: Response, user_id: str = Query(...)):
+    not_modified = check_etag(request, response, f"connections:{user_id}")
+    if not_modified:
+        return not_modified
+
     sent_requests = connections_collection.where("sender_id", "==", user_id).get()
     result = []
     for req in sent_requests:
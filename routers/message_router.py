@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Body, HTTPException
+from fastapi import APIRouter, Body, Query, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from db.firebase import firestore_db  # 🔁 Use Firebase instead of MongoDB
 from datetime import datetime
 from ws.manager import manager
+from middleware.rate_limiter import send_user_limiter, send_concurrency, user_ip_key
+from routers.connect_router import connection_pair_id
+from middleware.cache import check_etag, bump_version
 from cryptography.fernet import Fernet
 import base64
 
@@ -32,20 +36,36 @@ def get_user(user_id: str):
 
 @message_router.post("/send")
 async def send_message(
+    request: Request,
     sender_id: str = Body(...),
     receiver_id: str = Body(...),
     message: str = Body(...)
 ):
+    # 🚦 Reject floods before touching Firestore
+    limit_key = user_ip_key(sender_id, request)
+    send_user_limiter.check(limit_key)
+    if not send_concurrency.acquire(limit_key):
+        raise HTTPException(status_code=429, detail="Too many messages in flight.")
+    try:
+        # Firestore + Fernet are blocking; keep them off the event loop
+        message_id, encrypted_for_receiver = await run_in_threadpool(
+            _encrypt_and_store, sender_id, receiver_id, message
+        )
+    finally:
+        send_concurrency.release(limit_key)
+
+    # 🔔 Notify receiver via WebSocket
+    avatar_url = f"https://api.dicebear.com/8.x/adventurer/svg?seed={encrypted_for_receiver}"
+    await manager.send_personal_message(avatar_url, receiver_id)
+
+    return {"status": "Encrypted message sent", "message_id": message_id}
+
+
+def _encrypt_and_store(sender_id: str, receiver_id: str, message: str):
     # Firestore uses string IDs, no ObjectId check needed
     # 🔁 Check if a valid connection exists
-    connection_query = connections_collection.where("status", "==", "accepted").where(
-        "sender_id", "in", [sender_id, receiver_id]
-    ).where(
-        "receiver_id", "in", [sender_id, receiver_id]
-    ).stream()
-
-    connection = next(connection_query, None)
-    if not connection:
+    connection = connections_collection.document(connection_pair_id(sender_id, receiver_id)).get()
+    if not connection.exists or connection.to_dict().get("status") != "accepted":
         raise HTTPException(status_code=403, detail="Connection not accepted by the user")
 
     # 🔁 Fetch user documents from Firestore
@@ -71,12 +91,9 @@ async def send_message(
         "message_for_receiver": encrypted_for_receiver,
         "timestamp": datetime.utcnow()
     })
+    bump_version(f"messages:{sender_id}", f"messages:{receiver_id}")
 
-    # 🔔 Notify receiver via WebSocket
-    avatar_url = f"https://api.dicebear.com/8.x/adventurer/svg?seed={encrypted_for_receiver}"
-    await manager.send_personal_message(avatar_url, receiver_id)
-
-    return {"status": "Encrypted message sent", "message_id": doc_ref.id}
+    return doc_ref.id, encrypted_for_receiver
 
 
 
@@ -188,10 +205,21 @@ def decrypt_message(
 
 
 async def store_encrypted_message(sender_id: str, receiver_id: str, message: str):
+    # Firestore + Fernet are blocking; keep them off the event loop
+    encrypted_for_receiver = await run_in_threadpool(_store_encrypted, sender_id, receiver_id, message)
+    if encrypted_for_receiver is None:
+        return
+
+    await manager.send_personal_message(
+        f"Encrypted from {sender_id}: {encrypted_for_receiver}",
+        receiver_id
+    )
+
+
+def _store_encrypted(sender_id: str, receiver_id: str, message: str):
     # ⚠️ Firestore uses string IDs, no need for ObjectId validation
-    connection_query = connections_collection.where("status", "==", "accepted").where("sender_id", "in", [sender_id, receiver_id]).where("receiver_id", "in", [sender_id, receiver_id]).stream()
-    connection = next(connection_query, None)
-    if not connection:
+    connection = connections_collection.document(connection_pair_id(sender_id, receiver_id)).get()
+    if not connection.exists or connection.to_dict().get("status") != "accepted":
         return
 
     sender_doc = users_collection.document(sender_id).get()
@@ -219,11 +247,9 @@ async def store_encrypted_message(sender_id: str, receiver_id: str, message: str
         "message_for_receiver": encrypted_for_receiver,
         "timestamp": datetime.utcnow()
     })
+    bump_version(f"messages:{sender_id}", f"messages:{receiver_id}")
 
-    await manager.send_personal_message(
-        f"Encrypted from {sender_id}: {encrypted_for_receiver}",
-        receiver_id
-    )
+    return encrypted_for_receiver
 
 
 
@@ -279,6 +305,15 @@ def get_conversation(user1_id: str = Body(...), user2_id: str = Body(...)):
 
 
 
+@message_router.get("/chat-partners")
+def get_chat_partners_cached(request: Request, response: Response, user_id: str = Query(...)):
+    # GET variant so clients can revalidate with If-None-Match
+    not_modified = check_etag(request, response, f"messages:{user_id}")
+    if not_modified:
+        return not_modified
+    return get_chat_partners(user_id)
+
+
 @message_router.post("/chat-partners")
 def get_chat_partners(user_id: str = Body(...)):
     # Fetch messages where user is sender or receiver
@@ -0,0 +1,63 @@
+#Migrate connections to pair-keyed docs
+# One-off: moves auto-ID connection docs to the deterministic pair ID used by
+# routers/connect_router.py, collapsing duplicates (accepted wins over pending).
+# Run with FIREBASE_CREDENTIALS_JSON set:  python -m scripts.migrate_connection_pairs
+#
+# Run it TWICE: once before the deploy, and again right after it. Until the
+# new code is live, the old code keeps creating auto-ID docs that the new code
+# can't see (accepted connections would look missing and sends return 403).
+# Docs already at their pair ID are skipped, so re-running is safe.
+# Run with the same CACHE_VERSION_BACKEND as the app so cached listings of
+# every touched user are invalidated.
+from firebase_admin import firestore
+from db.firebase import firestore_db as db
+from routers.connect_router import connections_collection, connection_pair_id
+from middleware.cache import bump_version
+
+
+@firestore.transactional
+def _upsert_pair(transaction, pair_ref, data):
+    # Read + write in one transaction so a live accept can't be overwritten
+    snapshot = pair_ref.get(transaction=transaction)
+    # Never downgrade a pair doc that's already accepted
+    if snapshot.exists and snapshot.to_dict().get("status") == "accepted":
+        return
+    transaction.set(pair_ref, data)
+
+
+def migrate():
+    pairs = {}
+    legacy_ids = []
+
+    for doc in connections_collection.stream():
+        data = doc.to_dict()
+        if not data.get("sender_id") or not data.get("receiver_id"):
+            print(f"⚠️ Skipping {doc.id}: missing sender_id/receiver_id")
+            continue
+        pair_id = connection_pair_id(data["sender_id"], data["receiver_id"])
+        if doc.id == pair_id:
+            continue
+        legacy_ids.append(doc.id)
+
+        current = pairs.get(pair_id)
+        if current is None or (data.get("status") == "accepted" and current.get("status") != "accepted"):
+            pairs[pair_id] = data
+
+    for pair_id, data in pairs.items():
+        _upsert_pair(db.transaction(), connections_collection.document(pair_id), data)
+
+    for i in range(0, len(legacy_ids), 500):
+        batch = db.batch()
+        for doc_id in legacy_ids[i:i + 500]:
+            batch.delete(connections_collection.document(doc_id))
+        batch.commit()
+
+    # Duplicates are gone from /connect/list and /connect/sent-requests
+    for data in pairs.values():
+        bump_version(f"connections:{data['sender_id']}", f"connections:{data['receiver_id']}")
+
+    print(f"✅ Migrated {len(pairs)} pairs, removed {len(legacy_ids)} legacy docs")
+
+
+if __name__ == "__main__":
+    migrate()
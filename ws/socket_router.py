@@ -1,17 +1,37 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from ws.manager import manager  # ✅ Use the singleton instance
 from routers.message_router import store_encrypted_message  # ✅ Import the shared logic
+from middleware.rate_limiter import http_ip_limiter, ws_ip_limiter, ws_user_limiter, send_concurrency, client_ip, user_ip_key, WS_POLICY_VIOLATION
 
 socket_router = APIRouter()
 
 @socket_router.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
+    # 🚦 Connection attempts count against the same per-IP bucket as HTTP
+    ip = client_ip(websocket)
+    allowed, _ = http_ip_limiter.allow(ip)
+    if not allowed:
+        await websocket.close(code=WS_POLICY_VIOLATION)
+        return
+
     await manager.connect(user_id, websocket)
+    limit_key = user_ip_key(user_id, websocket)
 
     try:
         while True:
             data = await websocket.receive_json()
 
+            # 🚦 Per-IP then per-user frame limit: close the socket on flood.
+            # The IP bucket is shared by every socket from that address, so
+            # opening more sockets under new user IDs doesn't add throughput.
+            allowed, _ = ws_ip_limiter.allow(ip)
+            if allowed:
+                allowed, _ = ws_user_limiter.allow(limit_key)
+            if not allowed:
+                await websocket.close(code=WS_POLICY_VIOLATION, reason="Rate limit exceeded")
+                manager.disconnect(user_id)
+                return
+
             sender = data["sender"]
             receiver = data["receiver"]
             message = data["message"]
@@ -22,7 +42,13 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
                 continue
 
             # ✅ Store in DB and send real-time
-            await store_encrypted_message(sender, receiver, message)
+            if not send_concurrency.acquire(limit_key):
+                await websocket.send_text("Too many messages in flight. Try again.")
+                continue
+            try:
+                await store_encrypted_message(sender, receiver, message)
+            finally:
+                send_concurrency.release(limit_key)
 
     except WebSocketDisconnect:
         manager.disconnect(user_id)